@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Opt-in cache of passing test outcomes (``--dask-outcome-cache``).
+
+A test is keyed by a hash of its node id, parameters, its own file, the conftest files and
+project modules that file depends on (see :func:`module_dependencies`) and a fingerprint of
+the environment, including every installed distribution.  On top of that, the worker records
+the files each test imported or opened for reading while it ran (see
+:func:`record_dependencies`) and hashes them.  When the key and all recorded hashes
+match the ones stored the last time the test passed, the stored reports are replayed instead
+of submitting the test to the cluster.  Tests marked ``nondeterministic`` are never served
+from the cache.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import os
+import platform
+import sys
+import threading
+import types
+from contextlib import contextmanager
+
+import pytest
+
+from pytest_dask.shard import report_from_dict, report_to_dict
+
+OUTCOMES_CACHE_KEY = 'dask/outcomes'
+NONDETERMINISTIC_MARK = 'nondeterministic'
+
+# files installed with the interpreter are covered by the environment fingerprint.
+_ENVIRONMENT_PREFIXES = tuple(set(
+    os.path.join(os.path.abspath(p), '') for p in (sys.prefix, sys.exec_prefix)))
+
+
+def installed_distributions():
+    try:
+        import pkg_resources
+        return sorted('%s==%s' % (d.project_name, d.version) for d in pkg_resources.working_set)
+    except ImportError:
+        from importlib import metadata
+        return sorted('%s==%s' % (d.metadata['Name'], d.version)
+                      for d in metadata.distributions())
+
+
+def environment_fingerprint():
+    parts = [sys.version, sys.executable, platform.platform(), pytest.__version__]
+    parts.extend(installed_distributions())
+    return hashlib.sha1(u'\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def hash_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def _source_file(module):
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path
+
+
+def module_dependencies(module, rootdir, _seen=None):
+    """Source files of the project modules ``module`` refers to, transitively.
+
+    A module refers to another one when one of its globals is that module or was defined in
+    it.  Only modules under ``rootdir`` and outside the interpreter's prefixes are followed.
+    """
+    rootdir = os.path.join(str(rootdir), '')
+    seen = set() if _seen is None else _seen
+    for value in list(vars(module).values()):
+        if isinstance(value, types.ModuleType):
+            dependency = value
+        else:
+            dependency = sys.modules.get(getattr(value, '__module__', None) or '')
+        path = _source_file(dependency) if dependency is not None else None
+        if (path is None or path in seen or not path.startswith(rootdir) or
+                path.startswith(_ENVIRONMENT_PREFIXES)):
+            continue
+        seen.add(path)
+        module_dependencies(dependency, rootdir, seen)
+    return seen
+
+
+def conftest_files(path, rootdir):
+    """``conftest.py`` files from ``rootdir`` down to the directory of ``path``."""
+    rootdir = os.path.abspath(str(rootdir))
+    files = []
+    directory = os.path.dirname(os.path.abspath(str(path)))
+    while True:
+        candidate = os.path.join(directory, 'conftest.py')
+        if os.path.isfile(candidate):
+            files.append(candidate)
+        if directory == rootdir or os.path.dirname(directory) == directory:
+            break
+        directory = os.path.dirname(directory)
+    return files
+
+
+_recording = threading.local()
+_audit_hook_installed = []
+
+
+def _audit(event, args):
+    files = getattr(_recording, 'files', None)
+    if files is None:
+        return
+    if event == 'open':
+        path, mode, flags = args
+        if not isinstance(path, str):
+            return
+        if mode is None:
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                return
+        elif any(c in mode for c in 'wax+'):
+            return
+        files.add(os.path.abspath(path))
+    elif event == 'import' and args[1]:
+        files.add(os.path.abspath(args[1]))
+
+
+@contextmanager
+def record_dependencies():
+    """Collect the files the current thread imports or reads inside the block.
+
+    Imports of modules that are already loaded are not observable; those are covered by
+    :func:`module_dependencies` on the controller.  Recording needs audit hooks (Python 3.8+).
+    """
+    files = set()
+    if hasattr(sys, 'addaudithook'):
+        if not _audit_hook_installed:
+            sys.addaudithook(_audit)
+            _audit_hook_installed.append(True)
+        _recording.files = files
+    try:
+        yield files
+    finally:
+        _recording.files = None
+        for path in list(files):
+            if path.startswith(_ENVIRONMENT_PREFIXES) or not os.path.isfile(path):
+                files.discard(path)
+
+
+class OutcomeCache(object):
+
+    def __init__(self, config):
+        if getattr(config, 'cache', None) is None:
+            raise pytest.UsageError('--dask-outcome-cache requires the cacheprovider plugin')
+        self.config = config
+        self.rootdir = str(config.rootdir)
+        self.outcomes = config.cache.get(OUTCOMES_CACHE_KEY, {})
+        self.environment = environment_fingerprint()
+        self.hits = set()
+        self._file_hashes = {}
+        self._module_dependencies = {}
+        self._keys = {}
+        self._pending = {}
+
+    def __getstate__(self):
+        return {'config': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _hash_file(self, path):
+        if path not in self._file_hashes:
+            self._file_hashes[path] = hash_file(path)
+        return self._file_hashes[path]
+
+    def dependencies(self, item):
+        """The test's own file, its conftest files and the project modules it refers to."""
+        path = str(item.fspath)
+        if path not in self._module_dependencies:
+            files = set(conftest_files(path, self.rootdir))
+            module = getattr(item, 'module', None)
+            if module is not None:
+                files.update(module_dependencies(module, self.rootdir))
+            files.discard(path)
+            self._module_dependencies[path] = [path] + sorted(files)
+        return self._module_dependencies[path]
+
+    def key(self, item):
+        h = hashlib.sha1()
+        h.update(item.nodeid.encode('utf-8'))
+        h.update(self.environment.encode('utf-8'))
+        callspec = getattr(item, 'callspec', None)
+        if callspec is not None:
+            h.update(repr(sorted(callspec.params.items())).encode('utf-8'))
+        for path in self.dependencies(item):
+            h.update(path.encode('utf-8'))
+            h.update(str(self._hash_file(path)).encode('utf-8'))
+        return h.hexdigest()
+
+    def lookup(self, item):
+        """Return the cached passing reports for ``item``, or ``None`` on a miss."""
+        if NONDETERMINISTIC_MARK in item.keywords:
+            return None
+        key = self._keys[item.nodeid] = self.key(item)
+        entry = self.outcomes.get(item.nodeid)
+        if entry is None or entry['key'] != key:
+            return None
+        for path, digest in entry['files'].items():
+            if self._hash_file(path) != digest:
+                return None
+        self.hits.add(item.nodeid)
+        return [report_from_dict(r) for r in entry['reports']]
+
+    def pytest_runtest_logreport(self, report):
+        key = self._keys.get(report.nodeid)
+        if key is None or report.nodeid in self.hits:
+            return
+        reports = self._pending.setdefault(report.nodeid, [])
+        reports.append(report)
+        if report.when != 'teardown':
+            return
+        del self._pending[report.nodeid]
+        # hashed on the worker, so files that differ on the controller never match.
+        files = getattr(report, '_dask_dependencies', None)
+        if files is not None and all(r.passed for r in reports):
+            self.outcomes[report.nodeid] = {
+                'key': key, 'files': files, 'reports': [report_to_dict(r) for r in reports]}
+        else:
+            self.outcomes.pop(report.nodeid, None)
+
+    def pytest_sessionfinish(self, session):
+        self.config.cache.set(OUTCOMES_CACHE_KEY, self.outcomes)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.hits:
+            return
+        tr = terminalreporter
+        tr.write_sep('=', 'dask outcome cache: %d passing test(s) reused' % len(self.hits))
+        if tr.verbosity > 0:
+            for nodeid in sorted(self.hits):
+                tr.write_line('CACHED %s' % nodeid)
@@ -1,147 +1,14 @@
 # -*- coding: utf-8 -*-
+"""pytest entry point.
 
+This module is loaded in every pytest run, so it must stay cheap to import.  Everything that
+needs distributed or the serialization patches lives in :mod:`pytest_dask.runner` and is only
+imported when ``--dask`` is given.
+"""
 
 import pytest
-from _pytest.runner import CallInfo
-from distributed import Client, LocalCluster, as_completed
-from contextlib import contextmanager
-import sys
-
-# Ensure that the serializer is pathched appropriately.
-from pytest_dask.serde_patch import *  # noqa: F401,F403
-from pytest_dask.utils import get_imports, update_syspath, restore_syspath
-
-from logging import getLogger
-logger = getLogger(__name__)
-
-
-class DaskRunner(object):
-    def __init__(self, config):
-        self.config = config
-        self.scheduler_mode = config.getvalue("dask_scheduler_mode")
-        remote_cluster_address = config.getvalue('dask_scheduler_address')
-        if remote_cluster_address:
-            self.client = Client(remote_cluster_address)
-        else:
-            self.cluster = LocalCluster(
-                ip='127.0.0.1',
-                n_workers=int(config.getvalue('dask_nworkers')),
-                processes=config.getvalue('dask_scheduler_mode') == 'process'
-            )
-            self.client = Client(self.cluster, set_as_default=True)
-
-    def __getstate__(self):
-        return {'config': None}
-
-    def __setstate__(self, state):
-        for k in state:
-            pass
-
-    def pytest_runtestloop(self, session):
-        if (session.testsfailed and
-                not session.config.option.continue_on_collection_errors):
-            raise session.Interrupted(
-                "%d errors during collection" % session.testsfailed)
-
-        unregister_plugins = ['debugging', 'terminalreporter']
-        for p in unregister_plugins:
-            session.config.pluginmanager.unregister(p)
-
-        if session.config.option.collectonly:
-            return True
-
-        def generate_tasks(session):
-            for i, item in enumerate(session.items):
-
-                # @delayed(pure=False)
-                def run_test(_item):
-                    # ensure that the plugin manager gets recreated appropriately.
-                    _item.config.pluginmanager.__recreate__()
-                    results = self.pytest_runtest_protocol(item=_item, nextitem=None)
-                    return results
-
-                # hook = item.ihook
-                # try to ensure that the module gets treated as a dynamic module that does not
-                # exist.
-
-                # delattr(item.module, '__file__')
-                # setup = hook.pytest_runtest_setup
-                # make_report = hook.pytest_runtest_makereport
-
-                fut = self.client.submit(run_test, item, pure=False)
-                yield fut
-
-        with self.remote_syspath_ctx():
-            tasks = generate_tasks(session)
-
-            # log these reports to the console.
-            for resolved in as_completed(tasks):
-                t = resolved.result()
-                for report in t:
-                    session.ihook.pytest_runtest_logreport(report=report)
-
-        return True
-
-    @contextmanager
-    def remote_syspath_ctx(self):
-        # Due to test directories being dynamic in certain cases we should make sure that our
-        # workers are using the same pythonpath that we are using here.
-        original_sys_path = self.client.run(get_imports)
-        logger.debug("Original remote sys path %s", original_sys_path)
-        updated_sys_path = self.client.run(update_syspath, sys.path)
-        logger.debug("Updated remote sys path %s", updated_sys_path)
-        try:
-            yield
-        finally:
-            # restore correct syspath
-            for worker, value in original_sys_path.items():
-                self.client.run(restore_syspath, value, workers=[worker])
-
-            original_sys_path2 = self.client.run(get_imports)
-            assert original_sys_path == original_sys_path2
-
-    def call_and_report(self, item, when, log=True, **kwds):
-        call = self.call_runtest_hook(item, when, **kwds)
-        hook = item.ihook
-        report = hook.pytest_runtest_makereport(item=item, call=call)
-        return report
-
-    def call_runtest_hook(self, item, when, **kwds):
-        hookname = "pytest_runtest_" + when
-        ihook = getattr(item.ihook, hookname)
-        return CallInfo(lambda: ihook(item=item, **kwds), when=when)
-
-    # VENDORED so that we have access to the report objects and not just T/F
-    def pytest_runtest_protocol(self, item, log=True, nextitem=None):
-        hasrequest = hasattr(item, "_request")
-        if hasrequest and not item._request:
-            item._initrequest()
-        rep = self.call_and_report(item, "setup", log)
-        reports = [rep]
-        if rep.passed:
-            if item.config.option.setupshow:
-                # TODO figure out how to pass this test
-                # show_test_item(item)
-                pass
-            if not item.config.option.setuponly:
-                rep = self.call_and_report(item, "call", log)
-                reports.append(rep)
-        rep = self.call_and_report(item, "teardown", log, nextitem=None)
-        reports.append(rep)
-        # after all teardown hooks have been called
-        # want funcargs and request info to go away
-        if hasrequest:
-            item._request = False
-            item.funcargs = None
-        return reports
-
-    def pytest_runtest_setup(self, item):
-        item.session._setupstate.prepare(item)
-
-    def pytest_unconfigure(self, config):
-        """ called before test process is exited.  """
-        if hasattr(self, 'cluster'):
-            self.cluster.close()
+
+from pytest_dask import spool
 
 
 def pytest_addoption(parser):
@@ -182,9 +49,138 @@ def pytest_addoption(parser):
         default='4',
     )
 
+    group.addoption(
+        '--dask-spool-threshold',
+        type='int',
+        default=str(spool.DEFAULT_THRESHOLD),
+        help='captured output larger than this many characters is kept on the worker and '
+             'only fetched for failing tests (0 disables spooling).',
+    )
+
+    group.addoption(
+        '--dask-worker-resources',
+        dest='dask_worker_resources',
+        default='',
+        metavar='NAME=AMOUNT,...',
+        help='resource capacities of each local dask worker, e.g. "memory=8GB,db=1". '
+             'memory defaults to an even share of the machine memory.',
+    )
+
+    group.addoption(
+        '--dask-telemetry',
+        dest='dask_telemetry',
+        default='',
+        metavar='PATH',
+        help='write per-session scheduler metrics at the end of the run, as Prometheus text '
+             'if PATH ends in .prom and appended as a JSON line otherwise.',
+    )
+
+    group.addoption(
+        '--dask-telemetry-label',
+        dest='dask_telemetry_label',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help='label attached to the exported telemetry, may be given multiple times.',
+    )
+
+    group.addoption(
+        '--dask-record',
+        dest='dask_record',
+        default='',
+        metavar='PATH',
+        help='write the sequence of tests each worker ran, with their random seeds, to PATH.',
+    )
+
+    group.addoption(
+        '--dask-replay',
+        dest='dask_replay',
+        default='',
+        metavar='PATH',
+        help='re-run the per-worker test sequences recorded with --dask-record, '
+             'each sequence in order on a single, freshly started worker of the local cluster.',
+    )
+
+    group.addoption(
+        '--dask-outcome-cache',
+        dest='dask_outcome_cache',
+        action='store_true',
+        default=False,
+        help='reuse the reports of tests that passed before when neither their code, '
+             'dependencies, parameters nor the environment changed.',
+    )
+
+    group.addoption(
+        '--dask-shard',
+        dest='dask_shard',
+        default='',
+        metavar='i/N',
+        help='only run the i-th (1-based) of N duration-balanced shards of the collected tests.',
+    )
+
+    group.addoption(
+        '--dask-shard-output',
+        dest='dask_shard_output',
+        default='',
+        help='write the reports of this shard to the given file, see --dask-merge.',
+    )
+
+    group.addoption(
+        '--dask-durations',
+        dest='dask_durations',
+        default='',
+        metavar='FILE',
+        help='per-test durations shared by all shards to balance --dask-shard; written by '
+             '--dask-merge. Without it shards are split by node id only.',
+    )
+
+    group.addoption(
+        '--dask-merge',
+        dest='dask_merge',
+        action='append',
+        default=[],
+        metavar='FILE',
+        help='do not run any tests, merge the reports of --dask-shard-output files instead.',
+    )
+
 
 @pytest.mark.trylast
 def pytest_configure(config):
+    if config.getoption("dask_merge"):
+        from pytest_dask.shard import ShardMerger
+        merger = ShardMerger(config, config.getoption("dask_merge"),
+                             config.getoption("dask_durations"))
+        config.pluginmanager.register(merger, "dask_merge")
+        return
+
+    if config.getoption("dask_shard"):
+        from pytest_dask.shard import ShardSelector, load_durations, parse_shard
+        index, count = parse_shard(config.getoption("dask_shard"))
+        durations_path = config.getoption("dask_durations")
+        durations = load_durations(durations_path) if durations_path else {}
+        selector = ShardSelector(config, index, count, config.getoption("dask_shard_output"),
+                                 durations)
+        config.pluginmanager.register(selector, "dask_shard")
+
+    config.addinivalue_line(
+        'markers',
+        'dask_priority(n): run this test n priority levels ahead of the rest under --dask.')
+
+    config.addinivalue_line(
+        'markers',
+        'dask_resources(**amounts): dask worker resources this test needs under --dask, '
+        'e.g. dask_resources(memory="4GB", db=1).')
+
+    config.addinivalue_line(
+        'markers',
+        'nondeterministic: never reuse a cached outcome for this test under '
+        '--dask-outcome-cache.')
+
+    if config.getoption("dask") and config.getoption("dask_outcome_cache"):
+        from pytest_dask.outcomes import OutcomeCache
+        config.pluginmanager.register(OutcomeCache(config), "dask_outcome_cache")
+
     if config.getoption("dask"):
+        from pytest_dask.runner import DaskRunner
         dask_session = DaskRunner(config)
         config.pluginmanager.register(dask_session, "dask_session")
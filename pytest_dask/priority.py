@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Dask task priorities for tests that are likely to fail.
+
+Tests that failed last time (``cache/lastfailed``), tests whose file changed since the previous
+dask run and tests marked ``@pytest.mark.dask_priority(n)`` get a higher ``priority=`` so that
+the scheduler runs them first.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import time
+
+LASTFAILED_PRIORITY = 100
+MODIFIED_PRIORITY = 50
+PRIORITY_MARK = 'dask_priority'
+LAST_RUN_CACHE_KEY = 'dask/last_run'
+
+
+def _mtime(path, cache):
+    if path not in cache:
+        try:
+            cache[path] = os.path.getmtime(path)
+        except OSError:
+            cache[path] = 0
+    return cache[path]
+
+
+def compute_priorities(config, items):
+    """Return a ``{nodeid: priority}`` mapping and remember when this run started."""
+    cache = getattr(config, 'cache', None)
+    lastfailed = cache.get('cache/lastfailed', {}) if cache is not None else {}
+    last_run = cache.get(LAST_RUN_CACHE_KEY, None) if cache is not None else None
+
+    mtimes = {}
+    priorities = {}
+    for item in items:
+        priority = 0
+        if item.nodeid in lastfailed:
+            priority += LASTFAILED_PRIORITY
+        if last_run is not None and _mtime(str(item.fspath), mtimes) > last_run:
+            priority += MODIFIED_PRIORITY
+        mark = item.keywords.get(PRIORITY_MARK)
+        if mark is not None and getattr(mark, 'args', None):
+            priority += int(mark.args[0])
+        priorities[item.nodeid] = priority
+
+    if cache is not None:
+        cache.set(LAST_RUN_CACHE_KEY, time.time())
+    return priorities
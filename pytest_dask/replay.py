@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Recording and replaying which tests ran together on a worker.
+
+``--dask-record`` writes, for every worker thread, the node ids it ran in the order they
+started and the seed ``random`` was given before each of them.  Local clusters use a single
+thread per worker while recording, so a sequence is everything one worker process ran.
+``--dask-replay`` restarts the workers and submits each sequence as a single task pinned to a
+worker of its own, so every sequence runs in order inside one fresh process while the
+sequences themselves still run in parallel.  Only the local cluster is ever restarted, a
+remote scheduler is refused.
+"""
+
+from __future__ import absolute_import, print_function
+
+import io
+import json
+
+import pytest
+
+
+class ScheduleRecorder(object):
+    def __init__(self):
+        self.workers = {}
+
+    def record(self, sequence, position, nodeid, seed):
+        self.workers.setdefault(sequence, []).append((position, nodeid, seed))
+
+    def sequences(self):
+        """``{sequence: [(nodeid, seed), ...]}`` in execution order."""
+        return {worker: [(nodeid, seed) for _, nodeid, seed in sorted(runs)]
+                for worker, runs in self.workers.items()}
+
+    def dump(self, path):
+        data = {'workers': {worker: [{'nodeid': nodeid, 'seed': seed} for nodeid, seed in runs]
+                            for worker, runs in self.sequences().items()}}
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(u'%s' % json.dumps(data, indent=2, sort_keys=True))
+
+
+def load_schedule(path):
+    """Load the per-worker sequences written by :meth:`ScheduleRecorder.dump`."""
+    try:
+        with io.open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return [[(run['nodeid'], run['seed']) for run in runs]
+                for _, runs in sorted(data['workers'].items())]
+    except (IOError, OSError) as e:
+        raise pytest.UsageError('--dask-replay: cannot read %s: %s' % (path, e))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise pytest.UsageError(
+            '--dask-replay: %s is not a schedule written by --dask-record' % (path, ))
+
+
+def schedule_batches(items, sequences):
+    """Map recorded sequences onto collected items as ``(items, seeds)`` batches."""
+    by_nodeid = {item.nodeid: item for item in items}
+    missing = [nodeid for runs in sequences for nodeid, _ in runs if nodeid not in by_nodeid]
+    if missing:
+        raise pytest.UsageError(
+            '--dask-replay: %d recorded test(s) were not collected, e.g. %s'
+            % (len(missing), missing[0]))
+    return [([by_nodeid[nodeid] for nodeid, _ in runs], [seed for _, seed in runs])
+            for runs in sequences if runs]
+
+
+def replay_workers(workers, batches):
+    """Assign every batch a worker of its own."""
+    if len(workers) < len(batches):
+        raise pytest.UsageError(
+            '--dask-replay: %d recorded sequence(s) need as many workers, only %d available'
+            % (len(batches), len(workers)))
+    return workers[:len(batches)]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Dask worker resources for ``@pytest.mark.dask_resources(memory="4GB", db=1)``.
+
+Marked tests are submitted with ``resources=`` so that the scheduler only runs as many of them
+concurrently as the workers have capacity for.  ``memory`` accepts byte strings, every other
+resource is a plain number.
+"""
+
+from __future__ import absolute_import, print_function
+
+import psutil
+from dask.utils import parse_bytes
+
+import pytest
+
+RESOURCES_MARK = 'dask_resources'
+
+
+def _parse_amount(name, value):
+    if name == 'memory' and not isinstance(value, (int, float)):
+        return parse_bytes(value)
+    return float(value)
+
+
+def parse_resources(resources):
+    """Normalize a ``{name: amount}`` mapping to numeric amounts."""
+    return {name: _parse_amount(name, value) for name, value in resources.items()}
+
+
+def parse_resources_option(value):
+    """Parse ``"memory=8GB,db=1"`` as given to ``--dask-worker-resources``."""
+    resources = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        try:
+            name, amount = part.split('=')
+        except ValueError:
+            raise pytest.UsageError(
+                '--dask-worker-resources expects name=amount pairs, got %r' % (part, ))
+        resources[name.strip()] = amount.strip()
+    return parse_resources(resources)
+
+
+def default_worker_resources(nworkers):
+    """Capacities for LocalCluster workers when none are given: an even share of memory."""
+    return {'memory': psutil.virtual_memory().total // nworkers}
+
+
+def item_resources(item):
+    """The resources requested by ``item``'s mark, or ``None`` if it is unmarked."""
+    mark = item.keywords.get(RESOURCES_MARK)
+    if mark is None or not getattr(mark, 'kwargs', None):
+        return None
+    return parse_resources(mark.kwargs)
+
+
+def batch_resources(items):
+    """Resources for a task running ``items`` one after the other, ``None`` if unmarked."""
+    resources = {}
+    for item in items:
+        for name, amount in (item_resources(item) or {}).items():
+            resources[name] = max(amount, resources.get(name, 0))
+    return resources or None
+
+
+def check_resources(requested, capacity):
+    """Raise if a request can never be satisfied by a worker with ``capacity``.
+
+    Such a task would otherwise wait forever on the scheduler.
+    """
+    for name, amount in requested.items():
+        if amount > capacity.get(name, 0):
+            raise pytest.UsageError(
+                'test requires %s=%s but dask workers only provide %s; '
+                'see --dask-worker-resources' % (name, amount, capacity.get(name, 0)))
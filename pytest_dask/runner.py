@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""The dask test runner.
+
+Importing this module pulls in distributed and patches pytest's classes for serialization,
+so it is only imported once ``--dask`` is actually requested.
+"""
+
+from _pytest.runner import CallInfo
+import cloudpickle
+from distributed import Client, LocalCluster, as_completed, get_worker
+from contextlib import contextmanager
+import itertools
+import pytest
+import random
+import sys
+import threading
+
+# Ensure that the serializer is pathched appropriately.
+from pytest_dask.serde_patch import *  # noqa: F401,F403
+from pytest_dask import spool
+from pytest_dask.outcomes import hash_file, record_dependencies
+from pytest_dask.priority import compute_priorities
+from pytest_dask.replay import (ScheduleRecorder, load_schedule, replay_workers,
+                                schedule_batches)
+from pytest_dask.resources import (batch_resources, check_resources, default_worker_resources,
+                                   parse_resources_option)
+from pytest_dask.telemetry import SessionTelemetry, parse_labels
+from pytest_dask.utils import get_imports, update_syspath, restore_syspath, replay_reports
+
+try:
+    from dask import annotate
+except ImportError:  # dask < 2.30
+    annotate = None
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+# Counters of started tests per worker thread, used to record the order tests ran in.
+_positions = {}
+
+
+def forget_session(session_id, dask_scheduler=None):
+    """Drop the metadata of a session from the scheduler, see ``Client.run_on_scheduler``."""
+    sessions = dask_scheduler.task_metadata.get('pytest-dask', {})
+    sessions.pop(session_id, None)
+
+
+def run_batch(runner, items, seeds):
+    """Run ``items`` one after the other on this worker, seeding ``random`` before each."""
+    worker = get_worker().address
+    # threads of one worker run tests concurrently, so each thread is its own sequence.
+    sequence = '%s#%s' % (worker, threading.current_thread().name)
+    counter = _positions.setdefault(sequence, itertools.count())
+    results = []
+    for item, seed in zip(items, seeds):
+        position = next(counter)
+        random.seed(seed)
+        if item.config.getvalue('dask_outcome_cache'):
+            with record_dependencies() as files:
+                reports = runner.pytest_runtest_protocol(item=item, nextitem=None)
+            reports[-1]._dask_dependencies = {path: hash_file(path) for path in files}
+        else:
+            reports = runner.pytest_runtest_protocol(item=item, nextitem=None)
+        results.append((sequence, position, item.nodeid, seed, reports))
+    return worker, results
+
+
+class DaskRunner(object):
+    def __init__(self, config):
+        self.config = config
+        self.scheduler_mode = config.getvalue("dask_scheduler_mode")
+        remote_cluster_address = config.getvalue('dask_scheduler_address')
+        self.telemetry = SessionTelemetry(parse_labels(config.getvalue('dask_telemetry_label')))
+        self.schedule = ScheduleRecorder()
+        # read up front, so a bad file is reported before any worker is started.
+        replay_path = config.getvalue('dask_replay')
+        self.replay = load_schedule(replay_path) if replay_path else None
+        if self.replay is not None and remote_cluster_address:
+            raise pytest.UsageError(
+                '--dask-replay restarts the workers, so it cannot be used with '
+                '--dask-scheduler-address; replay on the local cluster instead')
+        # capacities of the workers we start ourselves, remote workers are configured by the user.
+        self.worker_resources = None
+        if remote_cluster_address:
+            self.client = Client(remote_cluster_address)
+        else:
+            n_workers = int(config.getvalue('dask_nworkers'))
+            self.worker_resources = default_worker_resources(n_workers)
+            self.worker_resources.update(
+                parse_resources_option(config.getvalue('dask_worker_resources')))
+            cluster_kwargs = {}
+            if config.getvalue('dask_record') or replay_path:
+                # one thread per worker, so a worker process runs exactly one sequence.
+                cluster_kwargs['threads_per_worker'] = 1
+            self.cluster = LocalCluster(
+                ip='127.0.0.1',
+                n_workers=n_workers,
+                processes=config.getvalue('dask_scheduler_mode') == 'process',
+                resources=self.worker_resources,
+                **cluster_kwargs
+            )
+            self.client = Client(self.cluster, set_as_default=True)
+
+    def __getstate__(self):
+        return {'config': None}
+
+    def __setstate__(self, state):
+        for k in state:
+            pass
+
+    def pytest_runtestloop(self, session):
+        if (session.testsfailed and
+                not session.config.option.continue_on_collection_errors):
+            raise session.Interrupted(
+                "%d errors during collection" % session.testsfailed)
+
+        unregister_plugins = ['debugging', 'terminalreporter']
+        for p in unregister_plugins:
+            session.config.pluginmanager.unregister(p)
+
+        if session.config.option.collectonly:
+            return True
+
+        if self.replay is not None:
+            # recorded sequences run as they were, without priorities or the outcome cache,
+            # each pinned to its own freshly started worker.
+            outcome_cache = None
+            batches = schedule_batches(session.items, self.replay)
+            priorities = None
+            replay_workers(list(self.client.scheduler_info()['workers']), batches)
+            # only ever restart the cluster we started; thread mode workers cannot be restarted.
+            if hasattr(self, 'cluster') and self.scheduler_mode == 'process':
+                self.client.restart()
+            pinned = replay_workers(sorted(self.client.scheduler_info()['workers']), batches)
+        else:
+            outcome_cache = session.config.pluginmanager.getplugin('dask_outcome_cache')
+            priorities = compute_priorities(session.config, session.items)
+            pinned = None
+            # submit likely failures first as well, the scheduler only reorders what it has seen.
+            items = sorted(session.items, key=lambda item: -priorities[item.nodeid])
+            rng = random.Random()
+            batches = [([item], [rng.randrange(2 ** 32)]) for item in items]
+
+        # fail before anything is submitted if a task could never be scheduled.
+        resources = [batch_resources(batch) for batch, _ in batches]
+        if self.worker_resources is not None:
+            for requested in resources:
+                if requested:
+                    check_resources(requested, self.worker_resources)
+
+        def generate_tasks(session):
+            for i, (batch, seeds) in enumerate(batches):
+
+                # @delayed(pure=False)
+                def run_test(payload):
+                    _items, _seeds = cloudpickle.loads(payload)
+                    # ensure that the plugin manager gets recreated appropriately.
+                    for _item in _items:
+                        _item.config.pluginmanager.__recreate__()
+                    worker, results = run_batch(self, _items, _seeds)
+                    for _, _, _, _, reports in results:
+                        for report in reports:
+                            spool.spool_report(report)
+                            if getattr(report, '_dask_spooled', None):
+                                report._dask_worker = worker
+                    return worker, cloudpickle.dumps(results)
+
+                # hook = item.ihook
+                # try to ensure that the module gets treated as a dynamic module that does not
+                # exist.
+
+                # delattr(item.module, '__file__')
+                # setup = hook.pytest_runtest_setup
+                # make_report = hook.pytest_runtest_makereport
+
+                # task keys carry the session id so a shared scheduler can tell sessions apart.
+                key = self.telemetry.task_key(i)
+                if outcome_cache is not None:
+                    cached = outcome_cache.lookup(batch[0])
+                    if cached is not None:
+                        replay_reports(session, cached)
+                        continue
+
+                submit_kwargs = {'key': key, 'resources': resources[i]}
+                if priorities is not None:
+                    submit_kwargs['priority'] = max(priorities[item.nodeid] for item in batch)
+                if pinned is not None:
+                    submit_kwargs.update(workers=[pinned[i]], allow_other_workers=False)
+
+                # Every task gets its own copy of the items, and with them of the session's
+                # setup state, fixtures and capture, even in thread mode where the workers
+                # share this process.  Pickled here rather than by dask so the telemetry sees
+                # the real size.
+                payload = cloudpickle.dumps((batch, seeds))
+                fut = self.client.submit(run_test, payload, **submit_kwargs)
+                self.telemetry.record_submit(key, len(payload))
+                yield fut
+
+        with self.remote_syspath_ctx(), self.spool_ctx():
+            with self.telemetry_ctx():
+                tasks = as_completed(generate_tasks(session))
+
+                # log these reports to the console.
+                for resolved in tasks:
+                    worker, results = resolved.result()
+                    nbytes = len(results)
+                    results = cloudpickle.loads(results)
+                    self.telemetry.record_result(
+                        resolved.key, worker, [r for _, _, _, _, t in results for r in t],
+                        nbytes)
+                    for sequence, position, nodeid, seed, t in results:
+                        self.schedule.record(sequence, position, nodeid, seed)
+                        for report in t:
+                            if report.failed:
+                                self.fetch_spooled(report)
+                        replay_reports(session, t)
+
+        return True
+
+    @contextmanager
+    def telemetry_ctx(self):
+        # label the session on the scheduler, and the tasks themselves where dask supports it.
+        session_id = self.telemetry.session_id
+        metadata = {'labels': self.telemetry.labels, 'started': self.telemetry.started}
+        self.client.set_metadata(['pytest-dask', session_id], metadata)
+        try:
+            if annotate is None:
+                yield
+            else:
+                with annotate(pytest_dask=dict(self.telemetry.labels, session=session_id)):
+                    yield
+        finally:
+            # a long lived scheduler would otherwise keep an entry for every session it served.
+            self.client.run_on_scheduler(forget_session, session_id)
+
+    def pytest_sessionfinish(self, session):
+        # also runs for interrupted sessions: those are often the schedules worth replaying.
+        record_path = self.config.getvalue('dask_record')
+        if record_path:
+            self.schedule.dump(record_path)
+
+        self.telemetry.finish()
+        path = self.config.getvalue('dask_telemetry')
+        if not path:
+            return
+        nthreads = getattr(self.client, 'nthreads', None) or self.client.ncores
+        self.telemetry.export(path, nthreads())
+
+    @contextmanager
+    def spool_ctx(self):
+        # Large captured output stays on the workers; only failing reports pull it back.
+        threshold = int(self.config.getvalue('dask_spool_threshold'))
+        spool.set_threshold(threshold)
+        self.client.run(spool.set_threshold, threshold)
+        try:
+            yield
+        finally:
+            self.client.run(spool.cleanup)
+            # in thread mode the workers share this process' spool directory.
+            spool.cleanup()
+
+    def fetch_spooled(self, report):
+        worker = getattr(report, '_dask_worker', None)
+        if worker is None:
+            return report
+
+        def fetch(path, is_bytes):
+            result = self.client.run(spool.read_spooled, path, is_bytes, workers=[worker])
+            return result[worker]
+
+        spool.unspool_report(report, fetch)
+        del report._dask_worker
+        return report
+
+    @contextmanager
+    def remote_syspath_ctx(self):
+        # Due to test directories being dynamic in certain cases we should make sure that our
+        # workers are using the same pythonpath that we are using here.
+        original_sys_path = self.client.run(get_imports)
+        logger.debug("Original remote sys path %s", original_sys_path)
+        updated_sys_path = self.client.run(update_syspath, sys.path)
+        logger.debug("Updated remote sys path %s", updated_sys_path)
+        try:
+            yield
+        finally:
+            # restore correct syspath
+            for worker, value in original_sys_path.items():
+                self.client.run(restore_syspath, value, workers=[worker])
+
+            original_sys_path2 = self.client.run(get_imports)
+            assert original_sys_path == original_sys_path2
+
+    def call_and_report(self, item, when, log=True, **kwds):
+        call = self.call_runtest_hook(item, when, **kwds)
+        hook = item.ihook
+        report = hook.pytest_runtest_makereport(item=item, call=call)
+        return report
+
+    def call_runtest_hook(self, item, when, **kwds):
+        hookname = "pytest_runtest_" + when
+        ihook = getattr(item.ihook, hookname)
+        return CallInfo(lambda: ihook(item=item, **kwds), when=when)
+
+    # VENDORED so that we have access to the report objects and not just T/F
+    def pytest_runtest_protocol(self, item, log=True, nextitem=None):
+        hasrequest = hasattr(item, "_request")
+        if hasrequest and not item._request:
+            item._initrequest()
+        rep = self.call_and_report(item, "setup", log)
+        reports = [rep]
+        if rep.passed:
+            if item.config.option.setupshow:
+                # TODO figure out how to pass this test
+                # show_test_item(item)
+                pass
+            if not item.config.option.setuponly:
+                rep = self.call_and_report(item, "call", log)
+                reports.append(rep)
+        rep = self.call_and_report(item, "teardown", log, nextitem=None)
+        reports.append(rep)
+        # after all teardown hooks have been called
+        # want funcargs and request info to go away
+        if hasrequest:
+            item._request = False
+            item.funcargs = None
+        return reports
+
+    def pytest_runtest_setup(self, item):
+        item.session._setupstate.prepare(item)
+
+    def pytest_unconfigure(self, config):
+        """ called before test process is exited.  """
+        if hasattr(self, 'cluster'):
+            self.cluster.close()
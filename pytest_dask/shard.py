@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Offline sharding of a test session across independent machines.
+
+``--dask-shard=i/N`` keeps only the i-th (1-based) of N duration-balanced slices of the
+collected tests and can write the resulting reports to a file (``--dask-shard-output``).
+``--dask-merge`` replays any number of those files through ``pytest_runtest_logreport`` so
+that the terminal summary and ``--junitxml`` cover the whole matrix.
+
+Every shard has to compute the same split, so durations only come from an explicit
+``--dask-durations`` file (written by ``--dask-merge``) that is passed to all shards.  Without
+one the split only depends on the node ids.
+"""
+
+from __future__ import absolute_import, print_function
+
+import heapq
+import io
+import json
+
+import pytest
+from _pytest.runner import TestReport
+
+from pytest_dask.utils import replay_reports
+
+DEFAULT_DURATION = 1.0
+
+# report attributes that are carried over besides the constructor arguments.
+_EXTRA_ATTRS = ('wasxfail',)
+
+
+def parse_shard(value):
+    """Parse ``"i/N"`` into a ``(index, count)`` pair with ``1 <= index <= count``."""
+    try:
+        index, count = (int(v) for v in value.split('/'))
+    except ValueError:
+        raise pytest.UsageError('--dask-shard expects i/N, got %r' % (value, ))
+    if not 1 <= index <= count:
+        raise pytest.UsageError('--dask-shard index must be in 1..%d, got %d' % (count, index))
+    return index, count
+
+
+def split_by_duration(nodeids, durations, count):
+    """Split ``nodeids`` into ``count`` shards of roughly equal total duration.
+
+    Uses the longest-processing-time-first greedy assignment.  Tests without a recorded
+    duration are assumed to take as long as the average known test.  The result only depends
+    on the inputs, so every shard computes the same split independently.
+    """
+    known = [durations[n] for n in nodeids if n in durations]
+    default = sum(known) / len(known) if known else DEFAULT_DURATION
+    ordered = sorted(nodeids, key=lambda n: (-durations.get(n, default), n))
+
+    shards = [[] for _ in range(count)]
+    heap = [(0.0, i) for i in range(count)]
+    for nodeid in ordered:
+        total, i = heapq.heappop(heap)
+        shards[i].append(nodeid)
+        heapq.heappush(heap, (total + durations.get(nodeid, default), i))
+    return shards
+
+
+def report_to_dict(report):
+    """Compact, JSON-serializable form of a ``TestReport``."""
+    longrepr = report.longrepr
+    if longrepr is not None and not isinstance(longrepr, (tuple, str)):
+        longrepr = str(longrepr)
+    data = {
+        'nodeid': report.nodeid,
+        'location': report.location,
+        'keywords': sorted(report.keywords),
+        'outcome': report.outcome,
+        'longrepr': longrepr,
+        'when': report.when,
+        'sections': report.sections,
+        'duration': report.duration,
+    }
+    for attr in _EXTRA_ATTRS:
+        if hasattr(report, attr):
+            data[attr] = getattr(report, attr)
+    return data
+
+
+def report_from_dict(data):
+    data = dict(data)
+    data['location'] = tuple(data['location'])
+    data['keywords'] = dict.fromkeys(data['keywords'], 1)
+    data['sections'] = [tuple(s) for s in data['sections']]
+    if isinstance(data['longrepr'], list):
+        data['longrepr'] = tuple(data['longrepr'])
+    return TestReport(**data)
+
+
+def load_durations(path):
+    with io.open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_durations(path, reports):
+    durations = {}
+    for report in reports:
+        durations[report.nodeid] = durations.get(report.nodeid, 0.0) + report.duration
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(u'%s' % json.dumps(durations, indent=2, sort_keys=True))
+
+
+def load_reports(path):
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield report_from_dict(json.loads(line))
+
+
+class ShardSelector(object):
+    def __init__(self, config, index, count, output=None, durations=None):
+        self.config = config
+        self.index = index
+        self.count = count
+        self.output = output
+        self.durations = durations or {}
+        self._file = None
+
+    def __getstate__(self):
+        # the output file only lives on the controller.
+        return {'config': None, 'index': self.index, 'count': self.count, 'output': None,
+                'durations': {}, '_file': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    # split what is left after -k/-m deselection, or filtered shards come out unbalanced.
+    @pytest.mark.trylast
+    def pytest_collection_modifyitems(self, session, config, items):
+        shards = split_by_duration([item.nodeid for item in items], self.durations, self.count)
+        selected = set(shards[self.index - 1])
+
+        keep, deselected = [], []
+        for item in items:
+            (keep if item.nodeid in selected else deselected).append(item)
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = keep
+
+    def pytest_sessionstart(self, session):
+        if self.output:
+            self._file = io.open(self.output, 'w', encoding='utf-8')
+
+    def pytest_runtest_logreport(self, report):
+        if self._file is not None:
+            self._file.write(u'%s\n' % json.dumps(report_to_dict(report)))
+
+    def pytest_sessionfinish(self, session):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def pytest_report_header(self, config):
+        return 'dask shard: %d/%d' % (self.index, self.count)
+
+
+class ShardMerger(object):
+    """Replay the reports of previously run shards instead of running any tests."""
+
+    def __init__(self, config, paths, durations_path=None):
+        self.config = config
+        self.paths = paths
+        self.durations_path = durations_path
+
+    def pytest_collection(self, session):
+        session.items = []
+        return True
+
+    def pytest_runtestloop(self, session):
+        # read everything up front so that overlapping shards fail before anything is reported.
+        shards = [list(load_reports(path)) for path in self.paths]
+        seen = {}
+        for path, reports in zip(self.paths, shards):
+            for nodeid in set(r.nodeid for r in reports):
+                if nodeid in seen:
+                    raise pytest.UsageError(
+                        '--dask-merge: %s ran in both %s and %s, the shards used different '
+                        'splits' % (nodeid, seen[nodeid], path))
+                seen[nodeid] = path
+
+        for reports in shards:
+            replay_reports(session, reports)
+        session.testscollected = len(seen)
+
+        if self.durations_path:
+            dump_durations(self.durations_path, [r for reports in shards for r in reports])
+        return True
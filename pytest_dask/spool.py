@@ -0,0 +1,124 @@
+"""Spooling of large captured output to worker-local files.
+
+Captured output above a threshold is written to a temporary file on the worker and only a
+truncated head/tail is kept inline.  The controller fetches the full output back only for the
+reports it actually needs to render (failures).
+
+Only the finished reports are spooled: while a test runs its output is still captured in
+memory by pytest, so this bounds what travels back to the controller, not the worker's peak.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import tempfile
+
+DEFAULT_THRESHOLD = 1024 * 1024
+KEEP = 4 * 1024
+
+_SPOOL_DIR_PREFIX = 'pytest-dask-spool-'
+
+_state = {'threshold': DEFAULT_THRESHOLD, 'dir': None}
+
+
+def set_threshold(threshold):
+    """Set the size (in characters/bytes) above which captured output gets spooled.
+
+    A threshold of ``0`` disables spooling.  Meant to be invoked on the workers through
+    ``client.run``.
+    """
+    _state['threshold'] = int(threshold)
+    return _state['threshold']
+
+
+def get_threshold():
+    return _state['threshold']
+
+
+def _spool_dir():
+    if _state['dir'] is None or not os.path.isdir(_state['dir']):
+        _state['dir'] = tempfile.mkdtemp(prefix=_SPOOL_DIR_PREFIX)
+    return _state['dir']
+
+
+def _marker(size, path, as_bytes):
+    msg = u'\n...[pytest-dask: %d total, truncated; full output spooled to %s]...\n' % (size, path)
+    return msg.encode('utf-8') if as_bytes else msg
+
+
+def should_spool(value):
+    threshold = _state['threshold']
+    return bool(threshold) and len(value) > threshold
+
+
+def spool(value):
+    """Write ``value`` to a worker-local file and return a truncated, picklable stand-in.
+
+    The stand-in is a dict with the ``head`` and ``tail`` of the value, its full ``size`` and
+    the ``path`` of the spooled copy.
+    """
+    fd, path = tempfile.mkstemp(dir=_spool_dir(), suffix='.out')
+    is_bytes = isinstance(value, bytes)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(value if is_bytes else value.encode('utf-8'))
+    # the inline form must stay within the threshold that triggered spooling.
+    threshold = _state['threshold']
+    keep = min(KEEP, threshold // 2) if threshold else KEEP
+    return {
+        'head': value[:keep],
+        'tail': value[len(value) - keep:],
+        'size': len(value),
+        'path': path,
+        'bytes': is_bytes,
+    }
+
+
+def truncated(spooled):
+    """Render the inline (truncated) form of a spooled value."""
+    marker = _marker(spooled['size'], spooled['path'], spooled['bytes'])
+    return spooled['head'] + marker + spooled['tail']
+
+
+def read_spooled(path, is_bytes=False):
+    """Read back the full contents of a spooled value.  Runs on the worker owning ``path``."""
+    with open(path, 'rb') as f:
+        value = f.read()
+    return value if is_bytes else value.decode('utf-8')
+
+
+def spool_report(report):
+    """Spool oversized captured sections of ``report`` in place.
+
+    The full contents are recorded in ``report._dask_spooled`` keyed by section index so
+    that :func:`unspool_report` can fetch them back.
+    """
+    spooled = {}
+    for i, (name, content) in enumerate(report.sections):
+        if should_spool(content):
+            info = spool(content)
+            spooled[i] = info
+            report.sections[i] = (name, truncated(info))
+    if spooled:
+        report._dask_spooled = spooled
+    return report
+
+
+def unspool_report(report, fetch):
+    """Restore spooled sections of ``report`` using ``fetch(path, is_bytes)``."""
+    spooled = getattr(report, '_dask_spooled', None)
+    if not spooled:
+        return report
+    for i, info in spooled.items():
+        name, _ = report.sections[i]
+        report.sections[i] = (name, fetch(info['path'], info['bytes']))
+    del report._dask_spooled
+    return report
+
+
+def cleanup():
+    """Remove this process' spool directory.  Meant to be invoked through ``client.run``."""
+    path, _state['dir'] = _state['dir'], None
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+    return path
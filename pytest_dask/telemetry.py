@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Per-session metrics of a dask test run (``--dask-telemetry``).
+
+Every task of a session is keyed with the session id, and annotated with it and the labels,
+so it can be told apart on a shared scheduler.  Bytes transferred are the serialized sizes of
+the task inputs and results.  At the end of the session the collected metrics are written
+either as Prometheus text (files ending in ``.prom``) or appended as one JSON line.
+"""
+
+from __future__ import absolute_import, print_function
+
+import io
+import json
+import time
+import uuid
+
+import pytest
+
+
+def parse_labels(values):
+    labels = {}
+    for value in values:
+        try:
+            name, label = value.split('=', 1)
+        except ValueError:
+            raise pytest.UsageError(
+                '--dask-telemetry-label expects name=value, got %r' % (value, ))
+        labels[name.strip()] = label.strip()
+    return labels
+
+
+class SessionTelemetry(object):
+    def __init__(self, labels=None):
+        self.session_id = uuid.uuid4().hex[:12]
+        self.labels = labels or {}
+        self.started = time.time()
+        self.finished = None
+        self.submitted = 0
+        self.completed = 0
+        self.turnaround_overhead = 0.0
+        self.run_time = 0.0
+        self.nbytes = 0
+        self.busy = {}
+        self._submit_times = {}
+
+    def task_key(self, index):
+        return 'pytest-%s-%d' % (self.session_id, index)
+
+    def record_submit(self, key, nbytes):
+        """Account for a submitted task whose serialized inputs take ``nbytes``."""
+        self.submitted += 1
+        self.nbytes += nbytes
+        self._submit_times[key] = time.time()
+
+    def record_result(self, key, worker, reports, nbytes):
+        """Account for a finished task whose serialized result took ``nbytes``.
+
+        Run time is the sum of the report durations.  Turnaround overhead is whatever remains
+        of the time from submitting the task to handling its result: queueing on the
+        scheduler, transfers, (de)serialization and the controller's own work on earlier
+        results.  It needs no clocks to agree between the controller and the workers.
+        """
+        turnaround = time.time() - self._submit_times.pop(key)
+        duration = sum(r.duration for r in reports)
+        self.completed += 1
+        self.run_time += duration
+        self.turnaround_overhead += max(turnaround - duration, 0.0)
+        self.nbytes += nbytes
+        self.busy[worker] = self.busy.get(worker, 0.0) + duration
+
+    def finish(self):
+        self.finished = time.time()
+
+    def occupancy(self, nthreads):
+        """Fraction of each worker's thread time spent running tests of this session."""
+        wall = (self.finished or time.time()) - self.started
+        if wall <= 0:
+            return {}
+        return {worker: busy / (wall * nthreads.get(worker, 1))
+                for worker, busy in self.busy.items()}
+
+    def to_dict(self, nthreads):
+        return {
+            'session': self.session_id,
+            'labels': self.labels,
+            'started': self.started,
+            'finished': self.finished,
+            'tasks_submitted': self.submitted,
+            'tasks_completed': self.completed,
+            'turnaround_overhead_seconds': self.turnaround_overhead,
+            'run_seconds': self.run_time,
+            'bytes_transferred': self.nbytes,
+            'worker_occupancy': self.occupancy(nthreads),
+        }
+
+    def to_prometheus(self, nthreads):
+        labels = dict(self.labels, session=self.session_id)
+
+        def fmt(extra=None):
+            items = sorted(dict(labels, **(extra or {})).items())
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                                     for k, v in items)
+
+        lines = []
+
+        def metric(name, kind, value, extra=None):
+            if not lines or not lines[-1].startswith(name):
+                lines.append('# TYPE %s %s' % (name, kind))
+            lines.append('%s%s %r' % (name, fmt(extra), value))
+
+        metric('pytest_dask_tasks_submitted_total', 'counter', self.submitted)
+        metric('pytest_dask_tasks_completed_total', 'counter', self.completed)
+        metric('pytest_dask_turnaround_overhead_seconds_total', 'counter',
+               self.turnaround_overhead)
+        metric('pytest_dask_run_seconds_total', 'counter', self.run_time)
+        metric('pytest_dask_bytes_transferred_total', 'counter', self.nbytes)
+        for worker, value in sorted(self.occupancy(nthreads).items()):
+            metric('pytest_dask_worker_occupancy_ratio', 'gauge', value, {'worker': worker})
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, nthreads):
+        if path.endswith('.prom'):
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(u'%s' % self.to_prometheus(nthreads))
+        else:
+            with io.open(path, 'a', encoding='utf-8') as f:
+                f.write(u'%s\n' % json.dumps(self.to_dict(nthreads), sort_keys=True))
@@ -16,3 +16,9 @@ def restore_syspath(syspath):
     import sys
     sys.path[:] = syspath
     return sys.path
+
+
+def replay_reports(session, reports):
+    """Log ``reports`` produced elsewhere (a worker, another shard) into ``session``."""
+    for report in reports:
+        session.ihook.pytest_runtest_logreport(report=report)
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import subprocess
+import sys
+
 import pytest
 from textwrap import dedent
 
@@ -79,3 +82,360 @@ def test_help_message(testdir):
         'dask:',
         '*--dask*',
     ])
+
+
+def test_spooled_output_fetched_for_failures(testdir):
+    """Large captured output of a failing test is fetched back in full."""
+    testdir.makepyfile("""
+        def test_noisy_pass():
+            print('a' * 100000)
+
+        def test_noisy_fail():
+            print('b' * 100000 + 'THE-END')
+            assert False
+    """)
+
+    result = testdir.runpytest(
+        '--dask',
+        '--dask-spool-threshold=1000',
+    )
+
+    result.stdout.fnmatch_lines([
+        '*bTHE-END*',
+    ])
+    assert 'truncated; full output spooled' not in result.stdout.str()
+    assert result.ret == 1
+
+
+def test_plugin_import_is_lightweight():
+    """Loading the entry point must not import distributed or patch pytest."""
+    code = dedent("""
+        import sys
+        import pytest_dask.plugin
+        heavy = ['distributed', 'cloudpickle', 'pytest_dask.serde_patch', 'pytest_dask.runner']
+        print(','.join(m for m in heavy if m in sys.modules))
+    """)
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.decode('utf-8').strip() == ''
+
+
+def test_shard_and_merge(testdir):
+    """Shards together run every test once, and merging them reports the whole suite."""
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('x', list(range(5)))
+        def test_param(x):
+            assert x != 3
+    """)
+
+    outputs = []
+    for i in (1, 2):
+        output = str(testdir.tmpdir.join('shard-%d.jsonl' % i))
+        testdir.runpytest('--dask-shard=%d/2' % i, '--dask-shard-output=%s' % output)
+        outputs.append(output)
+
+    junit = testdir.tmpdir.join('merged.xml')
+    durations = testdir.tmpdir.join('durations.json')
+    result = testdir.runpytest(
+        '--junitxml=%s' % junit,
+        '--dask-durations=%s' % durations,
+        *['--dask-merge=%s' % o for o in outputs]
+    )
+    result.stdout.fnmatch_lines([
+        '*1 failed, 4 passed*',
+    ])
+    assert 'tests="5"' in junit.read()
+    assert result.ret == 1
+
+    # the merged durations balance the next round of shards
+    for i in (1, 2):
+        result = testdir.runpytest('--dask-shard=%d/2' % i, '--dask-durations=%s' % durations)
+        assert result.ret in (0, 1)
+
+
+def test_merge_rejects_overlapping_shards(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            pass
+    """)
+    output = str(testdir.tmpdir.join('shard.jsonl'))
+    testdir.runpytest('--dask-shard=1/1', '--dask-shard-output=%s' % output)
+
+    result = testdir.runpytest('--dask-merge=%s' % output, '--dask-merge=%s' % output)
+    result.stderr.fnmatch_lines(['*ran in both*'])
+    assert result.ret != 0
+
+
+def test_outcome_cache(testdir):
+    """A second unchanged run reuses passing outcomes, except for nondeterministic tests."""
+    testdir.makepyfile("""
+        import pytest
+
+        def test_stable():
+            pass
+
+        def test_reads_data():
+            with open('data.txt') as f:
+                assert f.read()
+
+        @pytest.mark.nondeterministic
+        def test_random():
+            pass
+    """)
+    testdir.tmpdir.join('data.txt').write('v1')
+
+    first = testdir.runpytest('--dask', '--dask-outcome-cache')
+    assert 'dask outcome cache' not in first.stdout.str()
+
+    second = testdir.runpytest('--dask', '--dask-outcome-cache', '-v')
+    second.stdout.fnmatch_lines([
+        '*dask outcome cache: 2 passing test(s) reused*',
+        'CACHED *::test_reads_data',
+        'CACHED *::test_stable',
+    ])
+    assert second.ret == 0
+
+    # a changed data file that the test read invalidates only that test
+    testdir.tmpdir.join('data.txt').write('v2')
+    third = testdir.runpytest('--dask', '--dask-outcome-cache', '-v')
+    third.stdout.fnmatch_lines([
+        '*dask outcome cache: 1 passing test(s) reused*',
+        'CACHED *::test_stable',
+    ])
+
+
+def test_outcome_cache_is_per_test_file(testdir):
+    """Editing one test module keeps the passes of another one cached."""
+    testdir.makepyfile(
+        test_first="""
+            def test_first():
+                pass
+        """,
+        test_second="""
+            def test_second():
+                pass
+        """,
+    )
+    testdir.runpytest('--dask', '--dask-outcome-cache')
+
+    testdir.tmpdir.join('test_second.py').write('def test_second():\n    assert True\n')
+    result = testdir.runpytest('--dask', '--dask-outcome-cache', '-v')
+    result.stdout.fnmatch_lines([
+        '*dask outcome cache: 1 passing test(s) reused*',
+        'CACHED test_first.py::test_first',
+    ])
+
+
+def test_nondeterministic_marker_is_registered(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.nondeterministic
+        def test_random():
+            pass
+    """)
+    result = testdir.runpytest('--strict')
+    assert result.ret == 0
+
+
+def test_resources_mark(testdir):
+    """Tests marked with dask_resources only run on workers that provide them."""
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.dask_resources(db=1)
+        def test_needs_db():
+            pass
+
+        def test_plain():
+            pass
+    """)
+
+    result = testdir.runpytest('--dask', '--dask-worker-resources=db=1')
+    result.stdout.fnmatch_lines(['*2 passed*'])
+    assert result.ret == 0
+
+    result = testdir.runpytest('--dask')
+    result.stderr.fnmatch_lines(['*requires db=1.0 but dask workers only provide 0*'])
+
+
+def test_thread_mode(testdir):
+    """Thread mode runs tests concurrently, each with its own module fixture and report."""
+    testdir.makepyfile("""
+        import json
+        import time
+        import pytest
+
+        @pytest.fixture(scope='module')
+        def resource():
+            state = {'open': True}
+            yield state
+            state['open'] = False
+
+        @pytest.mark.parametrize('n', list(range(8)))
+        def test_sleep(resource, n):
+            started = time.time()
+            time.sleep(0.5)
+            with open('interval-%d.json' % n, 'w') as f:
+                json.dump([started, time.time()], f)
+            assert resource['open']
+            assert False, 'fail-%d' % n
+    """)
+
+    result = testdir.runpytest(
+        '--dask',
+        '--dask-scheduler-mode=thread',
+        '--dask-nworkers=4',
+    )
+    result.stdout.fnmatch_lines(['*8 failed*'])
+    assert "assert resource['open']" not in result.stdout.str()
+    for n in range(8):
+        assert 'fail-%d' % n in result.stdout.str()
+
+    import json
+    intervals = sorted(json.loads(testdir.tmpdir.join('interval-%d.json' % n).read())
+                       for n in range(8))
+    overlapping = [a for a, b in zip(intervals, intervals[1:]) if b[0] < a[1]]
+    assert overlapping
+
+
+def test_telemetry_export(testdir):
+    """A session writes its metrics to the telemetry file when it ends."""
+    import json
+
+    testdir.makepyfile("""
+        def test_one():
+            pass
+
+        def test_two():
+            pass
+    """)
+
+    path = testdir.tmpdir.join('telemetry.jsonl')
+    result = testdir.runpytest(
+        '--dask',
+        '--dask-telemetry=%s' % path,
+        '--dask-telemetry-label=job=ci',
+    )
+    assert result.ret == 0
+
+    metrics = json.loads(path.read())
+    assert metrics['labels'] == {'job': 'ci'}
+    assert metrics['tasks_submitted'] == metrics['tasks_completed'] == 2
+    # two pickled items and their reports are well beyond a few bytes each
+    assert metrics['bytes_transferred'] > 1000
+
+
+def test_telemetry_export_when_interrupted(testdir):
+    """A session interrupted by a collection error still writes its metrics."""
+    import json
+
+    testdir.makepyfile(test_one="""
+        def test_one():
+            pass
+    """, test_broken="""
+        raise ImportError('broken')
+    """)
+    path = testdir.tmpdir.join('telemetry.jsonl')
+    result = testdir.runpytest('--dask', '--dask-telemetry=%s' % path)
+    result.stdout.fnmatch_lines(['*Interrupted: 1 error*'])
+    assert result.ret == 2
+    assert json.loads(path.read())['tasks_submitted'] == 0
+
+
+def test_record_and_replay(testdir):
+    """A recorded schedule replays every test, in the recorded order per worker."""
+    import json
+
+    testdir.makepyfile("""
+        import random
+
+        def test_seeded():
+            random.random()
+
+        def test_other():
+            pass
+    """)
+
+    record = testdir.tmpdir.join('schedule.json')
+    result = testdir.runpytest('--dask', '--dask-record=%s' % record)
+    assert result.ret == 0
+    workers = json.loads(record.read())['workers']
+    assert sum(len(runs) for runs in workers.values()) == 2
+
+    result = testdir.runpytest('--dask', '--dask-replay=%s' % record, '-v')
+    result.stdout.fnmatch_lines(['*2 passed*'])
+    assert result.ret == 0
+
+
+def test_replay_needs_a_worker_per_sequence(testdir):
+    import json
+
+    testdir.makepyfile("""
+        def test_one():
+            pass
+
+        def test_two():
+            pass
+    """)
+    record = testdir.tmpdir.join('schedule.json')
+    record.write(json.dumps({'workers': {
+        'a#0': [{'nodeid': 'test_replay_needs_a_worker_per_sequence.py::test_one', 'seed': 1}],
+        'b#0': [{'nodeid': 'test_replay_needs_a_worker_per_sequence.py::test_two', 'seed': 2}],
+    }}))
+    result = testdir.runpytest('--dask', '--dask-nworkers=1', '--dask-replay=%s' % record)
+    result.stderr.fnmatch_lines(['*2 recorded sequence(s) need as many workers, only 1*'])
+    assert result.ret != 0
+
+
+def test_replay_refuses_remote_scheduler(testdir):
+    """Replaying restarts workers, which must never happen to a shared remote cluster."""
+    record = testdir.tmpdir.join('schedule.json')
+    record.write('{"workers": {}}')
+    testdir.makeconftest("""
+        import distributed
+
+        def fail(*args, **kwargs):
+            raise AssertionError('client.restart called')
+
+        distributed.Client.restart = fail
+    """)
+    testdir.makepyfile("""
+        def test_one():
+            pass
+    """)
+    result = testdir.runpytest('--dask', '--dask-scheduler-address=tcp://127.0.0.1:1',
+                               '--dask-replay=%s' % record)
+    result.stderr.fnmatch_lines(['*--dask-replay restarts the workers*'])
+    assert 'client.restart called' not in result.stdout.str() + result.stderr.str()
+    assert result.ret == 4
+
+
+def test_replay_rejects_missing_file(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            pass
+    """)
+    result = testdir.runpytest('--dask', '--dask-replay=missing.json')
+    result.stderr.fnmatch_lines(['*--dask-replay: cannot read missing.json*'])
+    assert result.ret == 4
+
+
+def test_shard_splits_after_deselection(testdir):
+    """Shards split the -k filtered tests, not the full collection."""
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('x', list(range(4)))
+        def test_wanted(x):
+            pass
+
+        @pytest.mark.parametrize('x', list(range(20)))
+        def test_other(x):
+            pass
+    """)
+
+    for i in (1, 2):
+        result = testdir.runpytest('--dask-shard=%d/2' % i, '-k', 'wanted')
+        result.stdout.fnmatch_lines(['*2 passed*'])
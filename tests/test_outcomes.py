@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pytest_dask.outcomes import (OutcomeCache, conftest_files, environment_fingerprint,
+                                  installed_distributions, module_dependencies,
+                                  record_dependencies)
+
+
+def test_record_dependencies(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('input')
+    output = tmpdir.join('output.txt')
+
+    with record_dependencies() as files:
+        data.read()
+        output.write('result')
+
+    assert str(data) in files
+    assert str(output) not in files
+
+
+def test_recording_is_scoped(tmpdir):
+    data = tmpdir.join('data.txt')
+    data.write('input')
+    with record_dependencies() as files:
+        pass
+    data.read()
+    assert str(data) not in files
+
+
+def test_fingerprint_covers_distributions():
+    assert any(d.lower().startswith('pytest==') for d in installed_distributions())
+    assert environment_fingerprint() == environment_fingerprint()
+
+
+def test_requires_cacheprovider():
+    class Config(object):
+        rootdir = '.'
+
+    with pytest.raises(pytest.UsageError):
+        OutcomeCache(Config())
+
+
+def test_module_dependencies(tmpdir, monkeypatch):
+    pkg = tmpdir.mkdir('deps_pkg')
+    pkg.join('__init__.py').write('')
+    pkg.join('base.py').write('VALUE = 1\n')
+    pkg.join('helpers.py').write('from deps_pkg import base\n\ndef helper():\n    pass\n')
+    pkg.join('unrelated.py').write('')
+    pkg.join('test_mod.py').write('from deps_pkg.helpers import helper\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    import deps_pkg.test_mod
+    import deps_pkg.unrelated  # noqa: F401
+    files = module_dependencies(deps_pkg.test_mod, str(tmpdir))
+    assert str(pkg.join('helpers.py')) in files
+    assert str(pkg.join('base.py')) in files
+    assert str(pkg.join('unrelated.py')) not in files
+
+
+def test_conftest_files(tmpdir):
+    tmpdir.join('conftest.py').write('')
+    sub = tmpdir.mkdir('sub')
+    sub.join('conftest.py').write('')
+    other = tmpdir.mkdir('other')
+    other.join('conftest.py').write('')
+    assert conftest_files(str(sub.join('test_a.py')), str(tmpdir)) == [
+        str(sub.join('conftest.py')), str(tmpdir.join('conftest.py'))]
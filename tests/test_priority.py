@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from pytest_dask.priority import (LAST_RUN_CACHE_KEY, LASTFAILED_PRIORITY, MODIFIED_PRIORITY,
+                                  compute_priorities)
+
+
+class FakeCache(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+class FakeConfig(object):
+    def __init__(self, **cache):
+        self.cache = FakeCache(cache)
+
+
+class FakeItem(object):
+    def __init__(self, nodeid, fspath, keywords=None):
+        self.nodeid = nodeid
+        self.fspath = fspath
+        self.keywords = keywords or {}
+
+
+@pytest.fixture
+def items(tmpdir):
+    old = tmpdir.join('test_old.py')
+    old.write('')
+    old.setmtime(time.time() - 3600)
+    new = tmpdir.join('test_new.py')
+    new.write('')
+    return [
+        FakeItem('test_old.py::test_a', old),
+        FakeItem('test_old.py::test_b', old, {'dask_priority': pytest.mark.dask_priority(7)}),
+        FakeItem('test_new.py::test_c', new),
+    ]
+
+
+def test_priorities(items):
+    config = FakeConfig(**{
+        'cache/lastfailed': {'test_old.py::test_a': True},
+        LAST_RUN_CACHE_KEY: time.time() - 60,
+    })
+    assert compute_priorities(config, items) == {
+        'test_old.py::test_a': LASTFAILED_PRIORITY,
+        'test_old.py::test_b': 7,
+        'test_new.py::test_c': MODIFIED_PRIORITY,
+    }
+
+
+def test_first_run_records_start(items):
+    config = FakeConfig()
+    priorities = compute_priorities(config, items)
+    assert priorities['test_new.py::test_c'] == 0
+    assert LAST_RUN_CACHE_KEY in config.cache
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pytest_dask.replay import ScheduleRecorder, load_schedule, replay_workers, schedule_batches
+
+
+class FakeItem(object):
+    def __init__(self, nodeid):
+        self.nodeid = nodeid
+
+
+def test_record_and_load(tmpdir):
+    recorder = ScheduleRecorder()
+    recorder.record('tcp://w2', 1, 'test_a.py::test_c', 3)
+    recorder.record('tcp://w1', 0, 'test_a.py::test_a', 1)
+    recorder.record('tcp://w2', 0, 'test_a.py::test_b', 2)
+
+    path = str(tmpdir.join('schedule.json'))
+    recorder.dump(path)
+    assert load_schedule(path) == [
+        [('test_a.py::test_a', 1)],
+        [('test_a.py::test_b', 2), ('test_a.py::test_c', 3)],
+    ]
+
+
+@pytest.mark.parametrize('content', [None, u'not json', u'{}', u'{"workers": {"a": [{}]}}'])
+def test_load_schedule_rejects_bad_files(tmpdir, content):
+    path = tmpdir.join('schedule.json')
+    if content is not None:
+        path.write_text(content, encoding='utf-8')
+    with pytest.raises(pytest.UsageError):
+        load_schedule(str(path))
+
+
+def test_schedule_batches():
+    items = [FakeItem('a'), FakeItem('b'), FakeItem('c')]
+    batches = schedule_batches(items, [[('c', 3), ('a', 1)], [], [('b', 2)]])
+    assert [([i.nodeid for i in batch], seeds) for batch, seeds in batches] == [
+        (['c', 'a'], [3, 1]),
+        (['b'], [2]),
+    ]
+    with pytest.raises(pytest.UsageError):
+        schedule_batches(items, [[('d', 4)]])
+
+
+def test_replay_workers():
+    batches = [([FakeItem('a')], [1]), ([FakeItem('b')], [2])]
+    assert replay_workers(['tcp://w1', 'tcp://w2', 'tcp://w3'], batches) == [
+        'tcp://w1', 'tcp://w2']
+    with pytest.raises(pytest.UsageError):
+        replay_workers(['tcp://w1'], batches)
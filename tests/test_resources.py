@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pytest_dask.resources import (batch_resources, check_resources, parse_resources,
+                                   parse_resources_option)
+
+
+def test_parse_resources():
+    assert parse_resources({'memory': '4GB', 'db': 1}) == {'memory': 4e9, 'db': 1.0}
+    assert parse_resources({'memory': 1024}) == {'memory': 1024.0}
+
+
+def test_parse_resources_option():
+    assert parse_resources_option('') == {}
+    assert parse_resources_option('memory=1kB, db=2') == {'memory': 1000, 'db': 2.0}
+    with pytest.raises(pytest.UsageError):
+        parse_resources_option('db')
+
+
+def test_check_resources():
+    check_resources({'db': 1}, {'db': 1, 'memory': 10})
+    with pytest.raises(pytest.UsageError):
+        check_resources({'db': 1}, {'memory': 10})
+    with pytest.raises(pytest.UsageError):
+        check_resources({'memory': 20}, {'memory': 10})
+
+
+def test_batch_resources():
+    class Item(object):
+        def __init__(self, **resources):
+            self.keywords = {'dask_resources': pytest.mark.dask_resources(**resources)}
+
+    class Plain(object):
+        keywords = {}
+
+    assert batch_resources([Plain()]) is None
+    assert batch_resources([Item(db=1, memory='1kB'), Plain(), Item(db=2)]) == {
+        'db': 2.0, 'memory': 1000}
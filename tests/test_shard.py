@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import pytest
+from _pytest.runner import TestReport
+
+from pytest_dask.shard import (dump_durations, load_durations, parse_shard, report_from_dict,
+                               report_to_dict, split_by_duration)
+
+
+def test_parse_shard():
+    assert parse_shard('2/3') == (2, 3)
+    for bad in ['0/3', '4/3', 'x', '1/2/3']:
+        with pytest.raises(pytest.UsageError):
+            parse_shard(bad)
+
+
+def test_split_by_duration_is_balanced():
+    durations = {'a': 10.0, 'b': 6.0, 'c': 4.0, 'd': 3.0, 'e': 3.0}
+    shards = split_by_duration(sorted(durations), durations, 2)
+    totals = [sum(durations[n] for n in shard) for shard in shards]
+    assert sorted(totals) == [13.0, 13.0]
+    assert sorted(n for shard in shards for n in shard) == sorted(durations)
+
+
+def test_split_by_duration_unknown_tests():
+    nodeids = ['t%d' % i for i in range(7)]
+    shards = split_by_duration(nodeids, {}, 3)
+    assert sorted(len(s) for s in shards) == [2, 2, 3]
+    assert shards == split_by_duration(list(reversed(nodeids)), {}, 3)
+
+
+def test_report_roundtrip():
+    report = TestReport(
+        nodeid='test_a.py::test_skip', location=('test_a.py', 3, 'test_skip'),
+        keywords={'test_skip': 1}, outcome='skipped', longrepr=('test_a.py', 4, 'Skipped: no'),
+        when='setup', sections=[('Captured stdout setup', 'hi')], duration=0.5)
+    restored = report_from_dict(report_to_dict(report))
+    for attr in ['nodeid', 'location', 'keywords', 'outcome', 'longrepr', 'when', 'sections',
+                 'duration']:
+        assert getattr(restored, attr) == getattr(report, attr)
+
+
+def test_durations_roundtrip(tmpdir):
+    reports = [
+        TestReport(nodeid=nodeid, location=('test_a.py', 0, nodeid), keywords={},
+                   outcome='passed', longrepr=None, when=when, duration=duration)
+        for nodeid, when, duration in [('a', 'setup', 0.5), ('a', 'call', 1.0), ('b', 'call', 2.0)]
+    ]
+    path = str(tmpdir.join('durations.json'))
+    dump_durations(path, reports)
+    assert load_durations(path) == {'a': 1.5, 'b': 2.0}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from pytest_dask import spool
+
+
+@pytest.fixture
+def small_threshold():
+    original = spool.get_threshold()
+    spool.set_threshold(16)
+    yield 16
+    spool.set_threshold(original)
+    spool.cleanup()
+
+
+class FakeReport(object):
+    def __init__(self, sections):
+        self.sections = sections
+
+
+@pytest.mark.parametrize('value', [u'x' * 10000, b'y' * 10000])
+def test_spool_roundtrip(small_threshold, value):
+    assert spool.should_spool(value)
+    info = spool.spool(value)
+    inline = spool.truncated(info)
+    assert len(inline) < len(value)
+    assert os.path.exists(info['path'])
+    assert spool.read_spooled(info['path'], info['bytes']) == value
+
+
+def test_small_values_stay_inline(small_threshold):
+    assert not spool.should_spool(u'short')
+    spool.set_threshold(0)
+    assert not spool.should_spool(u'x' * 10000)
+
+
+def test_spool_report(small_threshold):
+    big = u'line\n' * 5000
+    report = FakeReport([('Captured stdout call', big), ('Captured stderr call', u'ok')])
+    spool.spool_report(report)
+    assert report.sections[1] == ('Captured stderr call', u'ok')
+    assert len(report.sections[0][1]) < len(big)
+
+    spool.unspool_report(report, spool.read_spooled)
+    assert report.sections[0] == ('Captured stdout call', big)
+    assert not hasattr(report, '_dask_spooled')
+
+
+def test_cleanup_removes_spool_dir(small_threshold):
+    info = spool.spool(u'z' * 100)
+    assert spool.cleanup() == os.path.dirname(info['path'])
+    assert not os.path.exists(info['path'])
+
+
+def test_inline_form_stays_within_threshold():
+    original = spool.get_threshold()
+    spool.set_threshold(1000)
+    try:
+        value = u''.join(u'%d\n' % i for i in range(1200))[:5000]
+        assert 1000 < len(value) < 2 * spool.KEEP
+        info = spool.spool(value)
+        assert len(info['head']) + len(info['tail']) <= 1000
+        assert len(spool.truncated(info)) < len(value)
+        assert value.startswith(info['head']) and value.endswith(info['tail'])
+    finally:
+        spool.set_threshold(original)
+        spool.cleanup()
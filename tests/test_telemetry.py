@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from pytest_dask.telemetry import SessionTelemetry, parse_labels
+
+
+class FakeReport(object):
+    def __init__(self, duration):
+        self.duration = duration
+
+
+@pytest.fixture
+def telemetry():
+    telemetry = SessionTelemetry({'ci': 'nightly'})
+    for i in range(3):
+        key = telemetry.task_key(i)
+        telemetry.record_submit(key, 5)
+        telemetry.record_result(key, 'tcp://w1', [FakeReport(0.0), FakeReport(0.0)], 10)
+    telemetry.finish()
+    return telemetry
+
+
+def test_parse_labels():
+    assert parse_labels(['a=1', 'b = x=y']) == {'a': '1', 'b': 'x=y'}
+    with pytest.raises(pytest.UsageError):
+        parse_labels(['a'])
+
+
+def test_task_keys_carry_session(telemetry):
+    assert telemetry.session_id in telemetry.task_key(0)
+
+
+def test_json_export(telemetry, tmpdir):
+    path = str(tmpdir.join('telemetry.jsonl'))
+    telemetry.export(path, {'tcp://w1': 2})
+    telemetry.export(path, {'tcp://w1': 2})
+    lines = [json.loads(line) for line in open(path)]
+    assert len(lines) == 2
+    assert lines[0]['session'] == telemetry.session_id
+    assert lines[0]['labels'] == {'ci': 'nightly'}
+    assert lines[0]['tasks_submitted'] == lines[0]['tasks_completed'] == 3
+    assert lines[0]['bytes_transferred'] == 45
+    assert set(lines[0]['worker_occupancy']) == {'tcp://w1'}
+
+
+def test_prometheus_export(telemetry, tmpdir):
+    path = tmpdir.join('telemetry.prom')
+    telemetry.export(str(path), {'tcp://w1': 2})
+    text = path.read()
+    assert '# TYPE pytest_dask_tasks_submitted_total counter' in text
+    assert ('pytest_dask_tasks_submitted_total{ci="nightly",session="%s"} 3'
+            % telemetry.session_id) in text
+    assert text.count('# TYPE pytest_dask_worker_occupancy_ratio gauge') == 1
+    assert 'worker="tcp://w1"' in text